@@ -7,6 +7,14 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Number of users disliking each food, most disliked first. Runs on the server
+# so dashboards don't pull every user document to count in Python.
+_DISLIKE_GROUP_STAGES = [
+    {"$unwind": "$disliked_foods"},
+    {"$group": {"_id": "$disliked_foods", "count": {"$sum": 1}}}
+]
+_DISLIKE_COUNTS_PIPELINE = _DISLIKE_GROUP_STAGES + [{"$sort": {"count": -1, "_id": 1}}]
+
 def get_admin_waste_insights(limit: int = 20) -> Dict:
     """
     Get aggregated insights about food waste across all users.
@@ -30,24 +38,33 @@ def get_admin_waste_insights(limit: int = 20) -> Dict:
         db = client["food_preferences"]
         users_collection = db['users']
         
-        # Get all users
-        all_users = list(users_collection.find({}, {"_id": 0, "user_id": 1, "disliked_foods": 1, "meal_count": 1}))
-        
-        # Aggregate dislikes across all users
-        dislike_counter = Counter()
-        total_users = len(all_users)
-        users_with_data = 0
-        
-        for user in all_users:
-            dislikes = user.get('disliked_foods', [])
-            if dislikes:
-                users_with_data += 1
-                for food in dislikes:
-                    dislike_counter[food] += 1
+        # User totals and per-food dislike counts in one round trip
+        result = next(users_collection.aggregate([
+            {"$facet": {
+                "totals": [
+                    {"$project": {"dislike_count": {"$size": {"$ifNull": ["$disliked_foods", []]}}}},
+                    {"$group": {
+                        "_id": None,
+                        "total_users": {"$sum": 1},
+                        "users_with_data": {"$sum": {"$cond": [{"$gt": ["$dislike_count", 0]}, 1, 0]}},
+                        "total_dislikes": {"$sum": "$dislike_count"}
+                    }}
+                ],
+                # Only the top foods come back; the number of distinct foods is
+                # counted separately so the facet result stays small
+                "dislikes": _DISLIKE_COUNTS_PIPELINE + [{"$limit": max(limit, 1)}],
+                "unique_dislikes": _DISLIKE_GROUP_STAGES + [{"$count": "n"}]
+            }}
+        ]))
+        
+        totals = result['totals'][0] if result['totals'] else {}
+        total_users = totals.get('total_users', 0)
+        users_with_data = totals.get('users_with_data', 0)
+        dislike_counts = [(row['_id'], row['count']) for row in result['dislikes']]
         
         # Calculate percentages and create insights
         top_dislikes = []
-        for food, count in dislike_counter.most_common(limit):
+        for food, count in dislike_counts[:limit]:
             percentage = (count / total_users) * 100 if total_users > 0 else 0
             
             # Determine severity
@@ -73,8 +90,8 @@ def get_admin_waste_insights(limit: int = 20) -> Dict:
             })
         
         # Calculate overall stats
-        total_unique_dislikes = len(dislike_counter)
-        avg_dislikes_per_user = sum(len(u.get('disliked_foods', [])) for u in all_users) / total_users if total_users > 0 else 0
+        total_unique_dislikes = result['unique_dislikes'][0]['n'] if result['unique_dislikes'] else 0
+        avg_dislikes_per_user = totals.get('total_dislikes', 0) / total_users if total_users > 0 else 0
         
         client.close()
         
@@ -116,28 +133,22 @@ def get_waste_trends_by_category() -> Dict:
         db = client["food_preferences"]
         users_collection = db['users']
         
-        # Get all users' dislikes
-        all_users = list(users_collection.find({}, {"_id": 0, "disliked_foods": 1}))
-        
-        # Categorize dislikes
+        # Count dislikes per food on the server, then categorize each distinct food once
         from recommendation_service import categorize_food
         
         category_dislikes = {}
-        for user in all_users:
-            for food in user.get('disliked_foods', []):
-                category = categorize_food(food)
-                if category not in category_dislikes:
-                    category_dislikes[category] = []
-                category_dislikes[category].append(food)
+        for row in users_collection.aggregate(_DISLIKE_COUNTS_PIPELINE):
+            category = categorize_food(row['_id'])
+            category_dislikes.setdefault(category, Counter())[row['_id']] = row['count']
         
         # Count by category
         category_stats = []
-        for category, foods in category_dislikes.items():
+        for category, food_counts in category_dislikes.items():
             category_stats.append({
                 "category": category,
-                "total_dislikes": len(foods),
-                "unique_items": len(set(foods)),
-                "most_common": Counter(foods).most_common(3)
+                "total_dislikes": sum(food_counts.values()),
+                "unique_items": len(food_counts),
+                "most_common": food_counts.most_common(3)
             })
         
         # Sort by total dislikes
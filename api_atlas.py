@@ -1,11 +1,20 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, render_template, abort, g, has_request_context
+from flask.logging import default_handler
 from flask_cors import CORS
+from flask_compress import Compress
+from werkzeug.exceptions import HTTPException, NotFound
 from user_preference_manager import UserFoodPreferenceManager
-import json
+import atexit
+import logging
+import orjson
 import os
+import queue
 import socket
+import uuid
+from logging.handlers import QueueHandler, QueueListener
 from dotenv import load_dotenv
 import services
+from cache import cache_get, cache_set, cache_hget, cache_hset
 # from pyngrok import ngrok
 
 # Load environment variables from .env file
@@ -14,6 +23,67 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)  # This enables CORS for all routes and all origins
 
+# --- Logging ---
+class RequestIdFilter(logging.Filter):
+    """Tag each log record with the id of the request that emitted it."""
+    def filter(self, record):
+        record.request_id = g.get('request_id', '-') if has_request_context() else '-'
+        return True
+
+# Request threads only enqueue records; a listener thread does the stream I/O
+_log_queue = queue.Queue(-1)
+_queue_handler = QueueHandler(_log_queue)
+_queue_handler.addFilter(RequestIdFilter())
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(logging.Formatter(
+    "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+))
+_log_listener = QueueListener(_log_queue, _stream_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logging.getLogger().addHandler(_queue_handler)
+logging.getLogger().setLevel(logging.INFO)
+app.logger.removeHandler(default_handler)
+
+@app.before_request
+def assign_request_id():
+    """Reuse the caller's X-Request-ID or mint one for this request."""
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+
+@app.after_request
+def add_request_id_header(response):
+    response.headers['X-Request-ID'] = g.get('request_id', '-')
+    return response
+
+# Reject uploads over 10MB before they are buffered
+app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024
+
+# Compress JSON responses over 500 bytes (brotli when the client accepts it)
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = 500
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html']
+Compress(app)
+
+# How long (seconds) per-user responses are served from Redis
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 300))
+
+def dump_json(payload) -> bytes:
+    """
+    Serialize payload with orjson.
+
+    orjson handles datetimes natively; default=str covers Mongo ObjectIds.
+    """
+    return orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+def json_response(body: bytes, status=200):
+    """Wrap an already serialized JSON body in a response."""
+    return app.response_class(body, status=status, mimetype='application/json')
+
+def ojsonify(payload, status=200):
+    """Serialize payload with orjson and wrap it in a JSON response."""
+    return json_response(dump_json(payload), status)
+
 # --- Documentation ---
 @app.route('/')
 @app.route('/docs')
@@ -176,45 +246,35 @@ def analyze_image():
     """
     Analyze an uploaded image file for food waste.
     """
-    try:
-        if 'file' not in request.files:
-            return jsonify({"success": False, "error": "No file part"}), 400
-            
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({"success": False, "error": "No selected file"}), 400
-
-        image_bytes = file.read()
-        analysis_result = services.analyze_food_waste_image(image_bytes)
-        return jsonify({"success": True, "analysis": analysis_result}), 200
+    if 'file' not in request.files:
+        abort(400, description="No file part")
         
-    except Exception as e:
-        print(f"Analysis error: {e}")
-        return jsonify({"success": False, "error": str(e)}), 500
+    file = request.files['file']
+    if file.filename == '':
+        abort(400, description="No selected file")
+
+    # Hand over the upload stream rather than reading it into one bytes object
+    analysis_result = services.analyze_food_waste_file(file.stream)
+    return ojsonify({"success": True, "analysis": analysis_result}, 200)
 
 @app.route('/api/analyze/url', methods=['POST'])
 def analyze_url():
     """
     Analyze an image from a URL for food waste.
     """
-    try:
-        data = request.get_json()
-        if not data or 'image_url' not in data:
-            return jsonify({"success": False, "error": "image_url is required"}), 400
-            
-        image_url = data['image_url']
-        analysis_result = services.analyze_food_waste_url(image_url)
-        return jsonify({"success": True, "analysis": analysis_result}), 200
+    data = request.get_json()
+    if not data or 'image_url' not in data:
+        abort(400, description="image_url is required")
         
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
-
+    image_url = data['image_url']
+    analysis_result = services.analyze_food_waste_url(image_url)
+    return ojsonify({"success": True, "analysis": analysis_result}, 200)
 
 MONGODB_URI = os.getenv("MONGODB_URI")
 
 if not MONGODB_URI:
-    print("⚠️  WARNING: MONGODB_URI not set. Please set it as an environment variable or in the code.")
-    print("   The app will fail when trying to connect to MongoDB.")
+    app.logger.warning("MONGODB_URI not set. Please set it as an environment variable or in the code.")
+    app.logger.warning("The app will fail when trying to connect to MongoDB.")
 
 # Initialize the preference manager with Atlas (lazy initialization)
 manager = None
@@ -236,6 +296,13 @@ def get_manager():
             )
     return manager
 
+# Connect at startup so the first request doesn't pay for the Atlas handshake
+if MONGODB_URI:
+    try:
+        get_manager()
+    except RuntimeError as e:
+        app.logger.warning(e)
+
 @app.route('/api/user/preferences/update', methods=['POST'])
 def update_preferences():
     """
@@ -254,48 +321,28 @@ def update_preferences():
         "message": "Preferences updated successfully"
     }
     """
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                "success": False,
-                "error": "No JSON data provided"
-            }), 400
-        
-        user_id = data.get('user_id')
-        waste_analysis = data.get('waste_analysis')
-        
-        if not user_id:
-            return jsonify({
-                "success": False,
-                "error": "user_id is required"
-            }), 400
-        
-        if not waste_analysis:
-            return jsonify({
-                "success": False,
-                "error": "waste_analysis is required"
-            }), 400
-        
-        # Update user preferences
-        updated_user = get_manager().update_user_preferences(user_id, waste_analysis)
-        
-        # Remove MongoDB _id field for JSON serialization
-        if '_id' in updated_user:
-            del updated_user['_id']
-        
-        return jsonify({
-            "success": True,
-            "user": json.loads(json.dumps(updated_user, default=str)),
-            "message": "Preferences updated successfully"
-        }), 200
-        
-    except Exception as e:
-        return jsonify({
-            "success": False,
-            "error": str(e)
-        }), 500
+    data = request.get_json()
+    
+    if not data:
+        abort(400, description="No JSON data provided")
+    
+    user_id = data.get('user_id')
+    waste_analysis = data.get('waste_analysis')
+    
+    if not user_id:
+        abort(400, description="user_id is required")
+    
+    if not waste_analysis:
+        abort(400, description="waste_analysis is required")
+    
+    # Update user preferences
+    updated_user = get_manager().update_user_preferences(user_id, waste_analysis)
+    
+    return ojsonify({
+        "success": True,
+        "user": updated_user,
+        "message": "Preferences updated successfully"
+    }, 200)
 
 @app.route('/api/user/<user_id>/summary', methods=['GET'])
 def get_user_summary(user_id):
@@ -308,25 +355,22 @@ def get_user_summary(user_id):
         "summary": { ... }
     }
     """
-    try:
-        summary = get_manager().get_user_summary(user_id)
-        
-        if not summary:
-            return jsonify({
-                "success": False,
-                "error": "User not found"
-            }), 404
-        
-        return jsonify({
-            "success": True,
-            "summary": summary
-        }), 200
-        
-    except Exception as e:
-        return jsonify({
-            "success": False,
-            "error": str(e)
-        }), 500
+    cache_key = f"user:{user_id}:summary"
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return json_response(cached, 200)
+    
+    summary = get_manager().get_user_summary(user_id)
+    
+    if not summary:
+        abort(404, description="User not found")
+    
+    body = dump_json({
+        "success": True,
+        "summary": summary
+    })
+    cache_set(cache_key, body, USER_CACHE_TTL)
+    return json_response(body, 200)
 
 @app.route('/api/user/<user_id>/history', methods=['GET'])
 def get_meal_history(user_id):
@@ -342,22 +386,23 @@ def get_meal_history(user_id):
         "history": [ ... ]
     }
     """
-    try:
-        limit = request.args.get('limit', default=10, type=int)
-        
-        history = get_manager().get_meal_history(user_id, limit=limit)
-        
-        return jsonify({
-            "success": True,
-            "history": history,
-            "count": len(history)
-        }), 200
-        
-    except Exception as e:
-        return jsonify({
-            "success": False,
-            "error": str(e)
-        }), 500
+    limit = request.args.get('limit', default=10, type=int)
+    
+    # One hash per user, one field per limit, so a single delete invalidates all
+    cache_key = f"user:{user_id}:history"
+    cached = cache_hget(cache_key, str(limit))
+    if cached is not None:
+        return json_response(cached, 200)
+    
+    history = get_manager().get_meal_history(user_id, limit=limit)
+    
+    body = dump_json({
+        "success": True,
+        "history": history,
+        "count": len(history)
+    })
+    cache_hset(cache_key, str(limit), body, USER_CACHE_TTL)
+    return json_response(body, 200)
 
 @app.route('/api/user/<user_id>/recommendations', methods=['GET'])
 def get_recommendations(user_id):
@@ -374,23 +419,16 @@ def get_recommendations(user_id):
         "count": 5
     }
     """
-    try:
-        import recommendation_service
-        
-        limit = request.args.get('limit', default=10, type=int)
-        recommendations = recommendation_service.get_recommendations(user_id, limit=limit)
-        
-        return jsonify({
-            "success": True,
-            "recommendations": recommendations,
-            "count": len(recommendations)
-        }), 200
-        
-    except Exception as e:
-        return jsonify({
-            "success": False,
-            "error": str(e)
-        }), 500
+    import recommendation_service
+    
+    limit = request.args.get('limit', default=10, type=int)
+    recommendations = recommendation_service.get_recommendations(user_id, limit=limit)
+    
+    return ojsonify({
+        "success": True,
+        "recommendations": recommendations,
+        "count": len(recommendations)
+    }, 200)
 
 @app.route('/api/user/<user_id>/dislikes', methods=['GET'])
 def get_dislikes(user_id):
@@ -404,22 +442,15 @@ def get_dislikes(user_id):
         "count": 3
     }
     """
-    try:
-        import recommendation_service
-        
-        dislikes = recommendation_service.get_dislikes(user_id)
-        
-        return jsonify({
-            "success": True,
-            "dislikes": dislikes,
-            "count": len(dislikes)
-        }), 200
-        
-    except Exception as e:
-        return jsonify({
-            "success": False,
-            "error": str(e)
-        }), 500
+    import recommendation_service
+    
+    dislikes = recommendation_service.get_dislikes(user_id)
+    
+    return ojsonify({
+        "success": True,
+        "dislikes": dislikes,
+        "count": len(dislikes)
+    }, 200)
 
 @app.route('/api/user/<user_id>', methods=['GET'])
 def get_user(user_id):
@@ -432,29 +463,22 @@ def get_user(user_id):
         "user": { ... }
     }
     """
-    try:
-        user = get_manager().get_user(user_id)
-        
-        if not user:
-            return jsonify({
-                "success": False,
-                "error": "User not found"
-            }), 404
-        
-        # Remove MongoDB _id field
-        if '_id' in user:
-            del user['_id']
-        
-        return jsonify({
-            "success": True,
-            "user": json.loads(json.dumps(user, default=str))
-        }), 200
-        
-    except Exception as e:
-        return jsonify({
-            "success": False,
-            "error": str(e)
-        }), 500
+    cache_key = f"user:{user_id}"
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return json_response(cached, 200)
+    
+    user = get_manager().get_user(user_id)
+    
+    if not user:
+        abort(404, description="User not found")
+    
+    body = dump_json({
+        "success": True,
+        "user": user
+    })
+    cache_set(cache_key, body, USER_CACHE_TTL)
+    return json_response(body, 200)
 
 @app.route('/api/user/create', methods=['POST'])
 def create_user():
@@ -474,50 +498,30 @@ def create_user():
         "message": "User created successfully"
     }
     """
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                "success": False,
-                "error": "No JSON data provided"
-            }), 400
-        
-        user_id = data.get('user_id')
-        user_name = data.get('user_name')
-        
-        if not user_id:
-            return jsonify({
-                "success": False,
-                "error": "user_id is required"
-            }), 400
-        
-        # Check if user already exists
-        existing_user = get_manager().get_user(user_id)
-        if existing_user:
-            return jsonify({
-                "success": False,
-                "error": "User already exists"
-            }), 409
-        
-        # Create user
-        new_user = get_manager().create_user(user_id, user_name)
-        
-        # Remove MongoDB _id field
-        if '_id' in new_user:
-            del new_user['_id']
-        
-        return jsonify({
-            "success": True,
-            "user": json.loads(json.dumps(new_user, default=str)),
-            "message": "User created successfully"
-        }), 201
-        
-    except Exception as e:
-        return jsonify({
-            "success": False,
-            "error": str(e)
-        }), 500
+    data = request.get_json()
+    
+    if not data:
+        abort(400, description="No JSON data provided")
+    
+    user_id = data.get('user_id')
+    user_name = data.get('user_name')
+    
+    if not user_id:
+        abort(400, description="user_id is required")
+    
+    # Check if user already exists
+    existing_user = get_manager().get_user(user_id)
+    if existing_user:
+        abort(409, description="User already exists")
+    
+    # Create user
+    new_user = get_manager().create_user(user_id, user_name)
+    
+    return ojsonify({
+        "success": True,
+        "user": new_user,
+        "message": "User created successfully"
+    }, 201)
 
 @app.route('/api/user/<user_id>', methods=['DELETE'])
 def delete_user(user_id):
@@ -530,61 +534,42 @@ def delete_user(user_id):
         "message": "User deleted successfully"
     }
     """
-    try:
-        deleted = get_manager().delete_user(user_id)
-        
-        if not deleted:
-            return jsonify({
-                "success": False,
-                "error": "User not found"
-            }), 404
-        
-        return jsonify({
-            "success": True,
-            "message": "User deleted successfully"
-        }), 200
-        
-    except Exception as e:
-        return jsonify({
-            "success": False,
-            "error": str(e)
-        }), 500
+    deleted = get_manager().delete_user(user_id)
+    
+    if not deleted:
+        abort(404, description="User not found")
+    
+    return ojsonify({
+        "success": True,
+        "message": "User deleted successfully"
+    }, 200)
 
 @app.route('/api/dining-halls', methods=['GET'])
 def get_dining_halls():
     """Get list of all dining halls."""
-    try:
-        import food_matching_service
-        halls = food_matching_service.get_all_dining_halls()
-        return jsonify({"success": True, "dining_halls": halls, "count": len(halls)}), 200
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    import food_matching_service
+    halls = food_matching_service.get_all_dining_halls()
+    return ojsonify({"success": True, "dining_halls": halls, "count": len(halls)}, 200)
 
 @app.route('/api/dining-halls/<hall_name>/menu', methods=['GET'])
 def get_dining_hall_menu(hall_name):
     """Get menu items for a specific dining hall and meal period."""
-    try:
-        from dining_hall_manager import DiningHallManager
-        meal_period = request.args.get('meal_period', default='lunch', type=str)
-        manager = DiningHallManager(mongodb_uri=os.getenv("MONGODB_URI"), db_name="food_preferences")
-        items = manager.get_items_by_hall_and_period(hall_name, meal_period)
-        manager.close()
-        return jsonify({"success": True, "items": items, "count": len(items), "dining_hall": hall_name, "meal_period": meal_period}), 200
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    from dining_hall_manager import DiningHallManager
+    meal_period = request.args.get('meal_period', default='lunch', type=str)
+    manager = DiningHallManager(mongodb_uri=os.getenv("MONGODB_URI"), db_name="food_preferences")
+    items = manager.get_items_by_hall_and_period(hall_name, meal_period)
+    manager.close()
+    return ojsonify({"success": True, "items": items, "count": len(items), "dining_hall": hall_name, "meal_period": meal_period}, 200)
 
 @app.route('/api/user/<user_id>/matched-items', methods=['GET'])
 def get_user_matched_items(user_id):
     """Get dining hall items matched to user preferences."""
-    try:
-        import food_matching_service
-        dining_hall = request.args.get('dining_hall', default='North Campus Dining', type=str)
-        meal_period = request.args.get('meal_period', default='lunch', type=str)
-        limit = request.args.get('limit', default=10, type=int)
-        matched_items = food_matching_service.get_matched_items(user_id, dining_hall=dining_hall, meal_period=meal_period, limit=limit)
-        return jsonify({"success": True, "matched_items": matched_items, "count": len(matched_items), "dining_hall": dining_hall, "meal_period": meal_period}), 200
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    import food_matching_service
+    dining_hall = request.args.get('dining_hall', default='North Campus Dining', type=str)
+    meal_period = request.args.get('meal_period', default='lunch', type=str)
+    limit = request.args.get('limit', default=10, type=int)
+    matched_items = food_matching_service.get_matched_items(user_id, dining_hall=dining_hall, meal_period=meal_period, limit=limit)
+    return ojsonify({"success": True, "matched_items": matched_items, "count": len(matched_items), "dining_hall": dining_hall, "meal_period": meal_period}, 200)
 
 @app.route('/api/admin/waste-insights', methods=['GET'])
 def get_admin_waste_insights():
@@ -616,41 +601,27 @@ def get_admin_waste_insights():
         "recommendations": {...}
     }
     """
-    try:
-        import admin_analytics_service
-        
-        limit = request.args.get('limit', default=20, type=int)
-        insights = admin_analytics_service.get_admin_waste_insights(limit=limit)
-        
-        return jsonify({
-            "success": True,
-            **insights
-        }), 200
-        
-    except Exception as e:
-        return jsonify({
-            "success": False,
-            "error": str(e)
-        }), 500
+    import admin_analytics_service
+    
+    limit = request.args.get('limit', default=20, type=int)
+    insights = admin_analytics_service.get_admin_waste_insights(limit=limit)
+    
+    return ojsonify({
+        "success": True,
+        **insights
+    }, 200)
 
 @app.route('/api/admin/waste-by-category', methods=['GET'])
 def get_waste_by_category():
     """Get waste insights grouped by food category."""
-    try:
-        import admin_analytics_service
-        
-        trends = admin_analytics_service.get_waste_trends_by_category()
-        
-        return jsonify({
-            "success": True,
-            **trends
-        }), 200
-        
-    except Exception as e:
-        return jsonify({
-            "success": False,
-            "error": str(e)
-        }), 500
+    import admin_analytics_service
+    
+    trends = admin_analytics_service.get_waste_trends_by_category()
+    
+    return ojsonify({
+        "success": True,
+        **trends
+    }, 200)
 
 @app.route('/admin/dashboard', methods=['GET'])
 def admin_dashboard():
@@ -660,56 +631,61 @@ def admin_dashboard():
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
-    return jsonify({
+    return ojsonify({
         "status": "healthy",
         "service": "Food Preference API",
         "database": "MongoDB Atlas"
-    }), 200
+    }, 200)
 
 # Error handlers
+# Fixed error bodies are serialized once at import
+_NOT_FOUND_BODY = dump_json({"success": False, "error": "Endpoint not found"})
+_TOO_LARGE_BODY = dump_json({"success": False, "error": "Request exceeds the 10MB upload limit"})
+
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({
-        "success": False,
-        "error": "Endpoint not found"
-    }), 404
-
-@app.errorhandler(500)
-def internal_error(error):
-    return jsonify({
-        "success": False,
-        "error": "Internal server error"
-    }), 500
-
-def find_free_port(start_port=5000, max_attempts=10):
-    """Find an available port starting from start_port."""
-    for i in range(max_attempts):
-        port = start_port + i
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            try:
-                s.bind(('', port))
-                return port
-            except OSError:
-                continue
-    return None
+    # Unknown routes carry werkzeug's stock description; abort(404, ...) carries our own
+    if error.description == NotFound.description:
+        return json_response(_NOT_FOUND_BODY, 404)
+    return ojsonify({"success": False, "error": error.description}, 404)
+
+@app.errorhandler(413)
+def request_too_large(error):
+    return json_response(_TOO_LARGE_BODY, 413)
+
+@app.errorhandler(HTTPException)
+def http_error(error):
+    """Return abort() and other HTTP errors in the standard error shape."""
+    return ojsonify({"success": False, "error": error.description}, error.code)
+
+@app.errorhandler(Exception)
+def unhandled_error(error):
+    """Turn any uncaught exception into a 500 with the standard error shape."""
+    app.logger.exception(error)
+    return ojsonify({"success": False, "error": str(error)}, 500)
+
+def find_free_port(preferred_port=5000):
+    """Return preferred_port if it is free, otherwise a free port chosen by the OS."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        try:
+            s.bind(('', preferred_port))
+        except OSError:
+            s.bind(('', 0))
+        return s.getsockname()[1]
 
 if __name__ == '__main__':
-    print("🚀 Starting Food Preference API")
-    print("☁️  Using MongoDB Atlas (Cloud)")
+    app.logger.info("Starting Food Preference API")
+    app.logger.info("Using MongoDB Atlas (Cloud)")
     
     # Try to find an available port
     port = find_free_port(5000)
-    if port is None:
-        print("❌ Error: Could not find an available port")
-        exit(1)
     
     if port != 5000:
-        print(f"⚠️  Port 5000 is in use, using port {port} instead")
+        app.logger.warning(f"Port 5000 is in use, using port {port} instead")
     
-    print(f"\n🌐 Server running on:")
-    print(f"   Local:   http://localhost:{port}")
-    print(f"\n📱 To make this accessible anywhere:")
-    print(f"   1. Open a new terminal")
-    print(f"   2. Run this: ssh -R 80:localhost:port_number serveo.net")
+    app.logger.info(f"Server running on: http://localhost:{port}")
+    app.logger.info("To make this accessible anywhere, run: ssh -R 80:localhost:port_number serveo.net")
+    app.logger.info("For production, run under gunicorn (see Procfile) instead of this dev server")
     
-    app.run(debug=True, host='0.0.0.0', port=port)
\ No newline at end of file
+    # Debugger and reloader only when explicitly requested
+    app.run(debug=os.getenv("FLASK_DEBUG") == "1", host='0.0.0.0', port=port)
\ No newline at end of file
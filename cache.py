@@ -0,0 +1,87 @@
+import logging
+import redis
+import os
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+from typing import Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+# Seconds to wait on connecting to or hearing back from Redis. The cache is
+# optional, so a slow or unreachable Redis should cost a request a fraction of
+# a second, not hold a worker on the OS TCP timeout
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", 0.25))
+
+# Shared connection pool; caching is disabled when REDIS_URL is not set.
+# Failed calls aren't retried: the caller just falls through to MongoDB/OpenAI
+redis_client = redis.Redis.from_url(
+    REDIS_URL,
+    socket_connect_timeout=REDIS_TIMEOUT,
+    socket_timeout=REDIS_TIMEOUT,
+    retry_on_timeout=False,
+    retry=Retry(NoBackoff(), 0)
+) if REDIS_URL else None
+
+def cache_get(key: str) -> Optional[bytes]:
+    """
+    Get a cached value.
+
+    Returns None on a miss, when caching is disabled, or if Redis is unreachable.
+    """
+    if redis_client is None:
+        return None
+    try:
+        return redis_client.get(key)
+    except redis.RedisError as e:
+        logger.warning(f"Cache read failed for {key}: {e}")
+        return None
+
+def cache_set(key: str, value: bytes, ttl: int) -> None:
+    """Store a value for ttl seconds. Failures are logged and ignored."""
+    if redis_client is None:
+        return
+    try:
+        redis_client.setex(key, ttl, value)
+    except redis.RedisError as e:
+        logger.warning(f"Cache write failed for {key}: {e}")
+
+def cache_hget(key: str, field: str) -> Optional[bytes]:
+    """Get one field of a cached hash. Returns None on a miss or Redis error."""
+    if redis_client is None:
+        return None
+    try:
+        return redis_client.hget(key, field)
+    except redis.RedisError as e:
+        logger.warning(f"Cache read failed for {key}[{field}]: {e}")
+        return None
+
+def cache_hset(key: str, field: str, value: bytes, ttl: int) -> None:
+    """
+    Store one field of a cached hash and (re)set the hash's ttl.
+
+    Grouping variants of a value under one hash lets cache_delete drop them together.
+    """
+    if redis_client is None:
+        return
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hset(key, field, value)
+        pipe.expire(key, ttl)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Cache write failed for {key}[{field}]: {e}")
+
+def cache_delete(*keys: str) -> None:
+    """Invalidate cached keys. Failures are logged and ignored."""
+    if redis_client is None or not keys:
+        return
+    try:
+        redis_client.delete(*keys)
+    except redis.RedisError as e:
+        logger.warning(f"Cache invalidation failed for {keys}: {e}")
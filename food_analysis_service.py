@@ -1,154 +1,202 @@
 import openai
 import base64
-import json
+import boto3
+import hashlib
+import httpx
+import io
+import logging
+import msgspec
+import orjson
 import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Union
 from dotenv import load_dotenv
 from models import WasteAnalysis
+from prompts import SYSTEM_PROMPT
+from cache import cache_get, cache_set
 
 # Load environment variables
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_KEY")
-
-SYSTEM_PROMPT = """Analyze this image of unfinished food carefully. 
-
-Your task is to:
-1. Identify what the ORIGINAL meal was before eating
-2. Identify what food was THROWN AWAY (left on plate/uneaten)
-3. Estimate what food was EATEN (consumed/missing from original meal)
-4. Infer food preferences based on what was eaten vs thrown away
-
-Return your response ONLY as a JSON object with this EXACT structure:
-{
-    "original_meal": {
-        "name": "name of the dish/meal",
-        "description": "brief description of what the meal originally was"
-    },
-    "thrown_away": [
-        {
-            "item": "food item name",
-            "quantity": "estimated quantity (e.g., '1/2 cup', '3 pieces', '50%')",
-            "percentage_of_original": "estimated percentage left uneaten"
-        }
-    ],
-    "eaten": [
-        {
-            "item": "food item name",
-            "quantity": "estimated quantity consumed",
-            "percentage_of_original": "estimated percentage that was eaten"
-        }
-    ],
-    "food_preferences": {
-        "likely_dislikes": ["list of foods they seem to dislike based on what was thrown away"],
-        "likely_likes": ["list of foods they seem to like based on what was eaten"],
-        "insights": "brief insight about their eating preferences"
-    },
-    "waste_summary": {
-        "total_waste_percentage": "estimated overall waste percentage",
-        "waste_value": "low/medium/high"
-    }
+
+logger = logging.getLogger(__name__)
+
+# How long (seconds) an analysis is reused for an identical image or URL
+VISION_CACHE_TTL = int(os.getenv("VISION_CACHE_TTL", 86400))
+
+# When set, uploaded images are staged in this S3 bucket and sent to OpenAI by URL
+# instead of being inlined as a base64 data URL
+VISION_UPLOAD_BUCKET = os.getenv("VISION_UPLOAD_BUCKET")
+_s3 = boto3.client("s3") if VISION_UPLOAD_BUCKET else None
+
+# Read size for hashing/encoding images; a multiple of 3 so base64 chunks need no padding
+_CHUNK_SIZE = 3 * 64 * 1024
+
+# Magic-byte signatures for sniffing the uploaded image type (JPEG is the fallback)
+_IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+# Data URL prefixes, encoded once per MIME type
+_DATA_URL_PREFIXES = {
+    mime_type: f"data:{mime_type};base64,".encode('ascii')
+    for mime_type in ("image/jpeg", "image/png", "image/gif", "image/webp")
 }
 
-Return ONLY the JSON object, no other text or markdown."""
+# Deletes staged images in the background so the response isn't held up
+_cleanup_executor = ThreadPoolExecutor(max_workers=2)
 
-def _parse_json_response(response_text: str) -> Dict[str, Any]:
-    """Helper to safely parse JSON response from OpenAI."""
-    try:
-        # Log the raw response for debugging
-        print(f"[DEBUG] Raw OpenAI response: {response_text[:200]}...")
-        
-        if not response_text or not response_text.strip():
-            raise ValueError("OpenAI returned an empty response")
-        
-        response_text = response_text.strip()
-        
-        # Remove markdown code blocks if present
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-        response_text = response_text.strip()
-        
-        # Validate we have something that looks like JSON
-        if not response_text.startswith("{"):
-            raise ValueError(f"Response doesn't start with '{{': {response_text[:100]}")
-        
-        return json.loads(response_text)
-    except json.JSONDecodeError as e:
-        print(f"[ERROR] JSON decode failed: {e}")
-        print(f"[ERROR] Attempted to parse: {response_text[:500]}")
-        raise ValueError(f"Failed to parse JSON from OpenAI: {e}")
-    except Exception as e:
-        print(f"[ERROR] Unexpected error in parsing: {e}")
-        raise
+# Prompt part of every vision request, built once instead of per call
+_PROMPT_PART = {"type": "text", "text": SYSTEM_PROMPT}
+
+# Shared OpenAI client, created on first use so TLS/HTTP2 connections are reused
+_client = None
+
+def _get_client() -> openai.OpenAI:
+    """Get or initialize the shared OpenAI client."""
+    global _client
+    if _client is None:
+        _client = openai.OpenAI(
+            api_key=os.getenv("OPENAI_KEY"),
+            http_client=httpx.Client(
+                http2=True,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+                timeout=60
+            )
+        )
+    return _client
 
 def _call_openai_vision(payload_content: list) -> Dict[str, Any]:
     """Internal helper to call OpenAI API."""
     try:
-        print(f"[DEBUG] Calling OpenAI Vision API...")
-        response = openai.chat.completions.create(
+        logger.debug("Calling OpenAI Vision API...")
+        response = _get_client().chat.completions.create(
             model="gpt-4o",
             messages=[
                 {
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": SYSTEM_PROMPT},
+                        _PROMPT_PART,
                         *payload_content
                     ]
                 }
             ],
-            max_tokens=1000
+            max_tokens=1000,
+            response_format={"type": "json_object"}
         )
         
         # Extract response content
         response_content = response.choices[0].message.content
-        print(f"[DEBUG] OpenAI response received, length: {len(response_content) if response_content else 0}")
+        logger.debug(f"OpenAI response received, length: {len(response_content) if response_content else 0}")
         
         if not response_content:
             raise ValueError("OpenAI returned empty content")
         
-        result_dict = _parse_json_response(response_content)
-        
-        # Validate against the Pydantic model (this ensures structure compliance)
-        validated_result = WasteAnalysis(**result_dict)
-        return validated_result.model_dump()
+        # JSON mode guarantees a bare JSON object; decode and validate it
+        # against the WasteAnalysis schema in one pass
+        validated_result = msgspec.json.decode(response_content, type=WasteAnalysis)
+        return msgspec.to_builtins(validated_result)
         
     except openai.APIError as e:
-        print(f"[ERROR] OpenAI API Error: {e}")
+        logger.error(f"OpenAI API Error: {e}")
         raise Exception(f"OpenAI API Error: {str(e)}")
     except Exception as e:
-        print(f"[ERROR] Analysis failed: {e}")
+        logger.error(f"Analysis failed: {e}")
         # Re-raise with clear context
         raise Exception(f"Analysis failed: {str(e)}")
 
 
-def analyze_image_bytes(image_bytes: bytes) -> Dict[str, Any]:
-    """
-    Analyze an image provided as bytes.
-    """
-    base64_image = base64.b64encode(image_bytes).decode('utf-8')
-    payload = [
+def _image_url_payload(url: str) -> list:
+    """Build the image part of the vision request."""
+    return [
         {
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/jpeg;base64,{base64_image}"
+                "url": url
             }
         }
     ]
-    return _call_openai_vision(payload)
+
+def _cached_vision_call(cache_key: str, analyze) -> Dict[str, Any]:
+    """Return a cached analysis for cache_key, or run analyze() and cache the result."""
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return orjson.loads(cached)
+    
+    result = analyze()
+    cache_set(cache_key, orjson.dumps(result), VISION_CACHE_TTL)
+    return result
+
+def _sha256_file(stream) -> str:
+    """Hash a binary file object chunk by chunk."""
+    digest = hashlib.sha256()
+    while chunk := stream.read(_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def _sniff_mime_type(header: bytes) -> str:
+    """Detect the image MIME type from its first 12 bytes."""
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, mime_type in _IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    return "image/jpeg"
+
+def _encode_data_url(stream, mime_type: str) -> str:
+    """
+    Base64-encode a binary file object into a data URL, chunk by chunk,
+    so the raw image and its encoding are never both held in memory.
+    """
+    encoded = bytearray(_DATA_URL_PREFIXES[mime_type])
+    while chunk := stream.read(_CHUNK_SIZE):
+        encoded += base64.b64encode(chunk)
+    return encoded.decode('ascii')
+
+def _analyze_staged_image(stream, mime_type: str) -> Dict[str, Any]:
+    """
+    Upload the image to S3 and analyze it through a short-lived presigned URL.
+    """
+    key = f"tmp/{uuid.uuid4()}.{mime_type.split('/')[1]}"
+    _s3.upload_fileobj(stream, VISION_UPLOAD_BUCKET, key, ExtraArgs={"ContentType": mime_type})
+    try:
+        url = _s3.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": VISION_UPLOAD_BUCKET, "Key": key},
+            ExpiresIn=300
+        )
+        return _call_openai_vision(_image_url_payload(url))
+    finally:
+        _cleanup_executor.submit(_s3.delete_object, Bucket=VISION_UPLOAD_BUCKET, Key=key)
+
+def analyze_image_file(stream) -> Dict[str, Any]:
+    """
+    Analyze an image from a seekable binary file object, such as an upload stream.
+    """
+    cache_key = "vision:" + _sha256_file(stream)
+    
+    def analyze():
+        stream.seek(0)
+        mime_type = _sniff_mime_type(stream.read(12))
+        stream.seek(0)
+        if _s3 is not None:
+            return _analyze_staged_image(stream, mime_type)
+        return _call_openai_vision(_image_url_payload(_encode_data_url(stream, mime_type)))
+    
+    return _cached_vision_call(cache_key, analyze)
+
+def analyze_image_bytes(image_bytes: bytes) -> Dict[str, Any]:
+    """
+    Analyze an image provided as bytes.
+    """
+    return analyze_image_file(io.BytesIO(image_bytes))
 
 def analyze_image_url(image_url: str) -> Dict[str, Any]:
     """
     Analyze an image provided via URL.
     """
-    payload = [
-        {
-            "type": "image_url",
-            "image_url": {
-                "url": image_url
-            }
-        }
-    ]
-    return _call_openai_vision(payload)
+    cache_key = "vision:url:" + hashlib.sha256(image_url.encode()).hexdigest()
+    return _cached_vision_call(cache_key, lambda: _call_openai_vision(_image_url_payload(image_url)))
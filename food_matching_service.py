@@ -142,8 +142,7 @@ def get_matched_items(user_id: str, dining_hall: str = "North Campus Dining",
         # Sort by match score (descending)
         matched_items.sort(key=lambda x: x['match_score'], reverse=True)
         
-        # Close connections
-        user_manager.close()
+        # Close the dining hall connection (the user manager's client is shared)
         dining_manager.close()
         
         return matched_items[:limit]
@@ -1,28 +1,30 @@
 from typing import List, Optional, Dict, Any, Union
 from pydantic import BaseModel, Field
+import msgspec
 from datetime import datetime
 
 # --- Shared Models (Waste Analysis) ---
+# msgspec Structs so OpenAI replies are parsed and validated in a single C pass
 
-class OriginalMeal(BaseModel):
-    name: str = Field(default="Unknown")
-    description: str = Field(default="")
+class OriginalMeal(msgspec.Struct):
+    name: str = "Unknown"
+    description: str = ""
 
-class FoodItem(BaseModel):
+class FoodItem(msgspec.Struct):
     item: str
     quantity: str
     percentage_of_original: str
 
-class FoodPreferences(BaseModel):
+class FoodPreferences(msgspec.Struct):
     likely_dislikes: List[str] = []
     likely_likes: List[str] = []
     insights: str = ""
 
-class WasteSummary(BaseModel):
+class WasteSummary(msgspec.Struct):
     total_waste_percentage: str
     waste_value: str
 
-class WasteAnalysis(BaseModel):
+class WasteAnalysis(msgspec.Struct):
     original_meal: OriginalMeal
     thrown_away: List[FoodItem]
     eaten: List[FoodItem]
@@ -58,7 +60,7 @@ class UserSummary(UserResponse):
 
 # --- API Request/Response Models ---
 
-class UpdatePreferencesRequest(BaseModel):
+class UpdatePreferencesRequest(msgspec.Struct):
     user_id: str
     waste_analysis: WasteAnalysis
 
@@ -73,7 +75,7 @@ class MealHistoryResponse(BaseModel):
     history: List[Dict[str, Any]] 
     count: int
 
-class AnalysisResponse(BaseModel):
+class AnalysisResponse(msgspec.Struct):
     success: bool
     analysis: Optional[WasteAnalysis] = None
     error: Optional[str] = None
@@ -0,0 +1,41 @@
+# Prompt sent with every food waste image analysis request
+SYSTEM_PROMPT = """Analyze this image of unfinished food carefully. 
+
+Your task is to:
+1. Identify what the ORIGINAL meal was before eating
+2. Identify what food was THROWN AWAY (left on plate/uneaten)
+3. Estimate what food was EATEN (consumed/missing from original meal)
+4. Infer food preferences based on what was eaten vs thrown away
+
+Return your response ONLY as a JSON object with this EXACT structure:
+{
+    "original_meal": {
+        "name": "name of the dish/meal",
+        "description": "brief description of what the meal originally was"
+    },
+    "thrown_away": [
+        {
+            "item": "food item name",
+            "quantity": "estimated quantity (e.g., '1/2 cup', '3 pieces', '50%')",
+            "percentage_of_original": "estimated percentage left uneaten"
+        }
+    ],
+    "eaten": [
+        {
+            "item": "food item name",
+            "quantity": "estimated quantity consumed",
+            "percentage_of_original": "estimated percentage that was eaten"
+        }
+    ],
+    "food_preferences": {
+        "likely_dislikes": ["list of foods they seem to dislike based on what was thrown away"],
+        "likely_likes": ["list of foods they seem to like based on what was eaten"],
+        "insights": "brief insight about their eating preferences"
+    },
+    "waste_summary": {
+        "total_waste_percentage": "estimated overall waste percentage",
+        "waste_value": "low/medium/high"
+    }
+}
+
+Return ONLY the JSON object, no other text or markdown."""
@@ -92,7 +92,7 @@ def get_recommendations(user_id: str, limit: int = 10) -> List[Dict]:
         recommendations = []
         
         # Get meal history to calculate frequencies
-        history = manager.get_meal_history(user_id, limit=100)
+        history = manager.get_meal_history(user_id, limit=100, fields=['eaten'])
         
         # Count how often each liked food appears
         food_frequency = {}
@@ -161,7 +161,6 @@ def get_recommendations(user_id: str, limit: int = 10) -> List[Dict]:
         # Sort by match percentage (descending)
         recommendations.sort(key=lambda x: x['match_percentage'], reverse=True)
         
-        manager.close()
         return recommendations[:limit]
         
     except Exception as e:
@@ -196,7 +195,7 @@ def get_dislikes(user_id: str) -> List[Dict]:
             return []
         
         # Get meal history to find when foods were last wasted
-        history = manager.get_meal_history(user_id, limit=100)
+        history = manager.get_meal_history(user_id, limit=100, fields=['thrown_away', 'timestamp'])
         
         # Track frequency and last seen
         dislike_data = {}
@@ -232,7 +231,6 @@ def get_dislikes(user_id: str) -> List[Dict]:
         # Sort by frequency (descending)
         dislikes.sort(key=lambda x: x['frequency'], reverse=True)
         
-        manager.close()
         return dislikes
         
     except Exception as e:
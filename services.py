@@ -1,15 +1,2 @@
-from food_analysis_service import analyze_image_bytes, analyze_image_url
-
-def analyze_food_waste_image(image_bytes: bytes) -> dict:
-    """
-    Analyze an image of unfinished food provided as bytes.
-    Delegates to food_analysis_service.
-    """
-    return analyze_image_bytes(image_bytes)
-
-def analyze_food_waste_url(image_url: str) -> dict:
-    """
-    Analyze an image of unfinished food from a URL.
-    Delegates to food_analysis_service.
-    """
-    return analyze_image_url(image_url)
+# Thin aliases kept for callers of the older services API; food_analysis_service is the implementation.
+from food_analysis_service import analyze_image_bytes as analyze_food_waste_image, analyze_image_file as analyze_food_waste_file, analyze_image_url as analyze_food_waste_url
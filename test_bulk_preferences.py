@@ -0,0 +1,84 @@
+"""
+Test script for UserFoodPreferenceManager.update_user_preferences_bulk.
+
+Runs against the database in MONGODB_URI using throwaway users, and deletes
+them again afterwards.
+"""
+import sys
+import uuid
+sys.path.append('.')
+
+from user_preference_manager import UserFoodPreferenceManager
+
+
+def meal(likes, dislikes, waste):
+    """Build a minimal waste analysis."""
+    return {
+        "original_meal": {"name": "Bulk test meal"},
+        "eaten": [],
+        "thrown_away": [],
+        "food_preferences": {"likely_likes": likes, "likely_dislikes": dislikes},
+        "waste_summary": {"total_waste_percentage": waste}
+    }
+
+
+def check(label, condition):
+    print(f"   {'✅' if condition else '❌'} {label}")
+    return condition
+
+
+suffix = uuid.uuid4().hex[:8]
+user_a = f"bulk_test_a_{suffix}"
+user_b = f"bulk_test_b_{suffix}"
+
+entries = [
+    {"user_id": user_a, "waste_analysis": meal(["Rice", "broccoli"], ["olives"], "10%")},
+    {"user_id": user_b, "waste_analysis": meal(["pasta"], [], "50%")},
+    # Later meal flips broccoli to disliked and olives to liked for user A
+    {"user_id": user_a, "waste_analysis": meal(["olives"], ["Broccoli"], "30%")},
+    # Unparseable waste counts as a meal but stays out of the average
+    {"user_id": user_b, "waste_analysis": meal([], [], "N/A")},
+]
+
+manager = None
+passed = True
+try:
+    manager = UserFoodPreferenceManager()
+
+    print("Testing bulk preference update...")
+    result = manager.update_user_preferences_bulk(entries)
+    print(f"   Result: {result}")
+    passed &= check("2 users updated", result["users_updated"] == 2)
+    passed &= check("4 meals saved", result["meals_saved"] == 4)
+
+    print("\nChecking grouping and last-wins for user A...")
+    user = manager.get_user(user_a)
+    passed &= check("liked rice and olives", user["liked_foods"] == ["olives", "rice"])
+    passed &= check("disliked broccoli", user["disliked_foods"] == ["broccoli"])
+    passed &= check("2 meals counted", user["meal_count"] == 2)
+    passed &= check("average waste 20%", user["total_waste_percentage"] == 20.0)
+
+    history = manager.get_meal_history(user_a, limit=10, fields=['waste_summary'])
+    passed &= check("history newest first", [h["waste_summary"]["total_waste_percentage"] for h in history] == ["30%", "10%"])
+
+    print("\nChecking user B...")
+    user = manager.get_user(user_b)
+    passed &= check("liked pasta", user["liked_foods"] == ["pasta"])
+    passed &= check("2 meals counted", user["meal_count"] == 2)
+    passed &= check("average waste 50% (N/A left out)", user["total_waste_percentage"] == 50.0)
+
+    print("\nChecking empty batch...")
+    passed &= check("nothing written", manager.update_user_preferences_bulk([]) == {"users_updated": 0, "meals_saved": 0})
+
+except Exception as e:
+    print(f"\n❌ ERROR: {e}")
+    import traceback
+    traceback.print_exc()
+    passed = False
+finally:
+    if manager is not None:
+        manager.delete_user(user_a)
+        manager.delete_user(user_b)
+
+print(f"\n{'✅ All checks passed' if passed else '❌ Some checks failed'}")
+sys.exit(0 if passed else 1)
@@ -1,27 +1,32 @@
 import requests
 import time
 import sys
+from requests.adapters import HTTPAdapter
 
 BASE_URL = "http://localhost:5000"
 
+# One keep-alive session for every request instead of a new connection each time
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
 print(f"Testing server at {BASE_URL}...")
 
 def test_health():
     try:
-        response = requests.get(f"{BASE_URL}/health")
+        response = SESSION.get(f"{BASE_URL}/api/health", timeout=2)
         if response.status_code == 200:
             print("✅ Health check passed")
-            return true
+            return True
         else:
             print(f"❌ Health check failed: {response.status_code} {response.text}")
             return False
-    except requests.ConnectionError:
+    except requests.RequestException:
         print("❌ Could not connect to server")
         return False
 
 def test_docs():
     try:
-        response = requests.get(f"{BASE_URL}/docs")
+        response = SESSION.get(f"{BASE_URL}/docs", timeout=2)
         if response.status_code == 200:
             print("✅ Docs endpoint passed")
             return True
@@ -32,11 +37,11 @@ def test_docs():
         print(f"❌ Docs test error: {e}")
         return False
 
-# Simple retry logic
-for i in range(5):
+# Retry with exponential backoff (0.1s, 0.2s, 0.4s, ... capped at 5s)
+for i in range(8):
     if test_health():
         break
     print("Waiting for server to start...")
-    time.sleep(2)
+    time.sleep(min(0.1 * 2**i, 5))
 
 test_docs()
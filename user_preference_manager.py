@@ -1,15 +1,122 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, UpdateOne
 import certifi
-from pymongo.errors import ConnectionFailure, OperationFailure
-from datetime import datetime
+from pymongo.errors import BulkWriteError, ConnectionFailure, OperationFailure
+from pymongo.topology_description import TOPOLOGY_TYPE
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional
-import json
+import atexit
+import orjson
 import os
+import re
+import sys
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
+from cache import cache_delete
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Shared MongoClients keyed by URI so every manager reuses one connection pool
+_CLIENTS: Dict[str, MongoClient] = {}
+# Whether each shared client's deployment supports multi-document transactions,
+# decided once after its first successful ping
+_TRANSACTION_SUPPORT: Dict[str, bool] = {}
+# (uri, db_name) pairs whose indexes this process has already ensured
+_INDEXED_DBS = set()
+_clients_lock = threading.Lock()
+
+# Users written per bulk_write/transaction by update_user_preferences_bulk
+_BULK_CHUNK_SIZE = 200
+
+def _get_client(mongodb_uri: str) -> MongoClient:
+    """
+    Get or create the shared MongoClient for a URI.
+    
+    Args:
+        mongodb_uri: MongoDB Atlas connection string
+        
+    Returns:
+        Connected MongoClient
+    """
+    with _clients_lock:
+        client = _CLIENTS.get(mongodb_uri)
+        if client is None:
+            # certifi handles SSL verification; minPoolSize keeps warm TLS
+            # connections around and zstd/snappy compress the wire traffic
+            # (zlib needs no extra package, so it is the fallback).
+            # tz_aware returns UTC-aware datetimes, matching what we write.
+            client = MongoClient(
+                mongodb_uri,
+                tlsCAFile=certifi.where(),
+                maxPoolSize=200,
+                minPoolSize=10,
+                maxIdleTimeMS=300_000,
+                tz_aware=True,
+                compressors="zstd,snappy,zlib",
+                zlibCompressionLevel=6,
+                retryWrites=True,
+                serverSelectionTimeoutMS=5000,
+                connectTimeoutMS=10000,
+                socketTimeoutMS=5000
+            )
+            
+            # Test the connection; a client that can't connect isn't cached, so
+            # close it rather than leak its monitor threads and pool
+            try:
+                client.admin.command('ping')
+            except Exception:
+                client.close()
+                raise
+            print("Successfully connected to MongoDB Atlas!")
+            _CLIENTS[mongodb_uri] = client
+            
+            # Anything but a standalone server (replica set, sharded, load balanced;
+            # Atlas is always a replica set) supports transactions. Deciding here
+            # rather than per manager keeps a later election, when the topology
+            # briefly reports no primary, from silently dropping the transaction.
+            _TRANSACTION_SUPPORT[mongodb_uri] = client.topology_description.topology_type != TOPOLOGY_TYPE.Single
+        return client
+
+def _close_clients():
+    """Close every shared client (registered to run at interpreter exit)."""
+    with _clients_lock:
+        for client in _CLIENTS.values():
+            client.close()
+        _CLIENTS.clear()
+        _TRANSACTION_SUPPORT.clear()
+        _INDEXED_DBS.clear()
+
+atexit.register(_close_clients)
+
+# First number in a waste percentage such as "35%", " 12.5 % " or ".5%"
+_NUM_RE = re.compile(r'-?(?:\d+(?:\.\d*)?|\.\d+)')
+
+def _normalize_food(food: str) -> str:
+    """Normalize a food name (strip whitespace, lowercase)."""
+    return food.strip().lower()
+
+def _sort_preferences(user: Dict) -> Dict:
+    """
+    Sort a user's liked/disliked foods in place and return the user.
+    
+    The update pipeline appends foods in the order they were first recorded;
+    readers (e.g. recommendations, which take the first N likes) get them
+    alphabetically, as when the arrays were stored sorted.
+    """
+    for field in ('liked_foods', 'disliked_foods'):
+        if field in user:
+            user[field] = sorted(user[field])
+    return user
+
+# Fields returned for user documents, shared by reads and the post-update document
+_USER_PROJECTION = {"_id": 0}
+
+def _invalidate_user(user_id: str):
+    """Drop the API's cached user/summary/history responses for a user from Redis."""
+    cache_delete(f"user:{user_id}", f"user:{user_id}:summary", f"user:{user_id}:history")
+
 class UserFoodPreferenceManager:
     """
     Manages user food preferences in MongoDB Atlas based on food waste analysis.
@@ -35,25 +142,20 @@ class UserFoodPreferenceManager:
             raise ValueError("MongoDB URI must be provided either as parameter or MONGODB_URI environment variable")
         
         try:
-            # Connect to MongoDB Atlas with certifi for SSL verification
-            self.client = MongoClient(
-                self.mongodb_uri,
-                tlsCAFile=certifi.where(),
-                serverSelectionTimeoutMS=5000,
-                connectTimeoutMS=10000,
-                socketTimeoutMS=10000
-            )
-            
-            # Test the connection
-            self.client.admin.command('ping')
-            print("Successfully connected to MongoDB Atlas!")
+            self.client = _get_client(self.mongodb_uri)
             
             self.db = self.client[db_name]
             self.users_collection = self.db['users']
             self.history_collection = self.db['meal_history']
             
-            # Create indexes for better performance
-            self._create_indexes()
+            # User updates and their history rows are written in one transaction
+            # when the deployment supports it (not on a standalone server)
+            self.supports_transactions = _TRANSACTION_SUPPORT[self.mongodb_uri]
+            
+            # Create indexes for better performance (once per database per process)
+            if (self.mongodb_uri, db_name) not in _INDEXED_DBS:
+                self._create_indexes()
+                _INDEXED_DBS.add((self.mongodb_uri, db_name))
             
         except ConnectionFailure as e:
             print(f"Failed to connect to MongoDB Atlas: {e}")
@@ -68,9 +170,8 @@ class UserFoodPreferenceManager:
             # User collection indexes
             self.users_collection.create_index("user_id", unique=True)
             
-            # History collection indexes
-            self.history_collection.create_index("user_id")
-            self.history_collection.create_index("timestamp")
+            # History collection index: serves find({user_id}).sort(timestamp, -1).limit(n)
+            # as a bounded index scan with no in-memory sort
             self.history_collection.create_index([("user_id", 1), ("timestamp", -1)])
             
             print("Database indexes created successfully!")
@@ -99,13 +200,17 @@ class UserFoodPreferenceManager:
             user_id: Unique user identifier
             
         Returns:
-            User document or None if not found
+            User document (without _id) or None if not found
         """
         try:
-            return self.users_collection.find_one({"user_id": user_id})
+            user = self.users_collection.find_one({"user_id": user_id}, _USER_PROJECTION)
         except Exception as e:
             print(f"Error getting user: {e}")
             return None
+        
+        if user is not None:
+            _sort_preferences(user)
+        return user
     
     def create_user(self, user_id: str, user_name: str = None) -> Dict:
         """
@@ -118,19 +223,24 @@ class UserFoodPreferenceManager:
         Returns:
             Created user document
         """
+        now = datetime.now(timezone.utc)
         user_doc = {
             "user_id": user_id,
             "user_name": user_name,
             "liked_foods": [],
             "disliked_foods": [],
             "meal_count": 0,
+            "waste_sample_count": 0,
             "total_waste_percentage": 0.0,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
+            "created_at": now,
+            "updated_at": now
         }
         
         try:
             self.users_collection.insert_one(user_doc)
+            # insert_one adds the generated ObjectId to user_doc; callers never use it
+            user_doc.pop("_id", None)
+            _invalidate_user(user_id)
             return user_doc
         except Exception as e:
             print(f"Error creating user: {e}")
@@ -148,92 +258,296 @@ class UserFoodPreferenceManager:
             Updated user document
         """
         try:
-            # Get or create user
-            user = self.get_user(user_id)
-            if not user:
-                user = self.create_user(user_id)
-            
-            # Extract preferences from analysis
-            food_prefs = waste_analysis.get('food_preferences', {})
-            new_likes = food_prefs.get('likely_likes', [])
-            new_dislikes = food_prefs.get('likely_dislikes', [])
-            
-            # Get current preferences
-            current_likes = set(user.get('liked_foods', []))
-            current_dislikes = set(user.get('disliked_foods', []))
-            
-            # Normalize food names (lowercase, strip whitespace)
-            new_likes = [food.lower().strip() for food in new_likes]
-            new_dislikes = [food.lower().strip() for food in new_dislikes]
-            
-            # Add new likes (avoiding duplicates)
-            for food in new_likes:
-                if food and food not in current_likes:
-                    # Remove from dislikes if it was there (preference changed)
-                    current_dislikes.discard(food)
-                    current_likes.add(food)
-            
-            # Add new dislikes (avoiding duplicates)
-            for food in new_dislikes:
-                if food and food not in current_dislikes:
-                    # Remove from likes if it was there (preference changed)
-                    current_likes.discard(food)
-                    current_dislikes.add(food)
-            
-            # Parse waste percentage
-            waste_summary = waste_analysis.get('waste_summary', {})
-            waste_percentage_str = waste_summary.get('total_waste_percentage', '0%')
-            waste_percentage = float(waste_percentage_str.replace('%', ''))
-            
-            # Calculate running average of waste
-            meal_count = user.get('meal_count', 0)
-            current_avg_waste = user.get('total_waste_percentage', 0.0)
-            new_avg_waste = ((current_avg_waste * meal_count) + waste_percentage) / (meal_count + 1)
-            
-            # Update user document
-            update_result = self.users_collection.update_one(
-                {"user_id": user_id},
-                {
-                    "$set": {
-                        "liked_foods": sorted(list(current_likes)),
-                        "disliked_foods": sorted(list(current_dislikes)),
-                        "meal_count": meal_count + 1,
-                        "total_waste_percentage": round(new_avg_waste, 2),
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
+            # Extract normalized preferences from analysis
+            new_likes, new_dislikes = self._meal_preferences(waste_analysis)
+            waste_percentage = self._parse_waste_percentage(waste_analysis)
+            now = datetime.now(timezone.utc)
+            
+            pipeline = self._preference_update_pipeline(new_likes, new_dislikes, [waste_percentage], now)
+            
+            def apply(session):
+                # Merge preferences and update the running average on the server in
+                # one call; a missing user is created by the upsert
+                updated = self.users_collection.find_one_and_update(
+                    {"user_id": user_id},
+                    pipeline,
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                    projection=_USER_PROJECTION,
+                    session=session
+                )
+                
+                # Save meal history
+                self._save_meal_history(user_id, waste_analysis, now, session)
+                return updated
             
-            # Save meal history
-            self._save_meal_history(user_id, waste_analysis)
+            try:
+                updated_user = _sort_preferences(self._run_in_transaction(apply))
+            finally:
+                # Without a transaction the upsert stands even if the history write
+                # failed, so drop the cached responses either way
+                _invalidate_user(user_id)
             
-            # Return updated user
-            return self.get_user(user_id)
+            return updated_user
             
         except Exception as e:
             print(f"Error updating user preferences: {e}")
             raise
     
-    def _save_meal_history(self, user_id: str, waste_analysis: Dict):
+    def update_user_preferences_bulk(self, entries: List[Dict]) -> Dict:
         """
-        Save individual meal analysis to history collection.
+        Apply many meal analyses at once (batch reprocessing, imports).
+        
+        Meals are grouped by user so each user gets a single update, applied in
+        entry order (a later like/dislike of the same food wins). Users are
+        written in chunks of _BULK_CHUNK_SIZE, each chunk's updates in one
+        bulk_write and its history in one insert_many, in its own transaction
+        when supported; a failure leaves earlier chunks applied. Without
+        transaction support a failed user update doesn't stop the others in
+        its chunk: their history is still saved and the BulkWriteError re-raised.
         
         Args:
-            user_id: Unique user identifier
-            waste_analysis: JSON response from food waste analyzer API
+            entries: List of {"user_id": ..., "waste_analysis": ...} dicts, each
+                with an optional "timestamp" (datetime) for its history row
+            
+        Returns:
+            Counts of users updated/created and meals saved
+        """
+        if not entries:
+            return {"users_updated": 0, "meals_saved": 0}
+        
+        # user_id -> [liked foods, disliked foods, waste percentages]
+        per_user = {}
+        # user_id -> history rows, kept per user so only users whose update
+        # went through get history
+        history_by_user = {}
+        
+        try:
+            now = datetime.now(timezone.utc)
+            # Entries without a timestamp are spaced 1ms apart (BSON date precision)
+            # ending at now, so history sorts in entry order
+            first_timestamp = now - timedelta(milliseconds=len(entries) - 1)
+            
+            for index, entry in enumerate(entries):
+                user_id = entry['user_id']
+                waste_analysis = entry['waste_analysis']
+                likes, dislikes, wastes = per_user.setdefault(user_id, [set(), set(), []])
+                
+                meal_likes, meal_dislikes = self._meal_preferences(waste_analysis)
+                likes.difference_update(meal_dislikes)
+                dislikes.difference_update(meal_likes)
+                likes.update(meal_likes)
+                dislikes.update(meal_dislikes)
+                wastes.append(self._parse_waste_percentage(waste_analysis))
+                
+                timestamp = entry.get('timestamp') or first_timestamp + timedelta(milliseconds=index)
+                history_by_user.setdefault(user_id, []).append(
+                    self._meal_history_doc(user_id, waste_analysis, timestamp)
+                )
+            
+            def apply(session, user_ids):
+                updates = [
+                    UpdateOne(
+                        {"user_id": user_id},
+                        self._preference_update_pipeline(*per_user[user_id], now),
+                        upsert=True
+                    )
+                    for user_id in user_ids
+                ]
+                # Unordered so the server can apply the batch in any order
+                try:
+                    result = self.users_collection.bulk_write(updates, ordered=False, session=session)
+                except BulkWriteError as e:
+                    # Inside a transaction nothing in this chunk is committed, so fail it
+                    if session is not None:
+                        raise
+                    # Without one the other users' updates went through: save their
+                    # history before reporting the failure
+                    failed = {error['index'] for error in e.details['writeErrors']}
+                    applied_docs = [
+                        doc
+                        for index, user_id in enumerate(user_ids) if index not in failed
+                        for doc in history_by_user[user_id]
+                    ]
+                    if applied_docs:
+                        self.history_collection.insert_many(applied_docs, ordered=False)
+                    print(f"Bulk update failed for {len(failed)} of {len(user_ids)} users; "
+                          f"saved {len(applied_docs)} meals for the rest")
+                    raise
+                
+                history_docs = [doc for user_id in user_ids for doc in history_by_user[user_id]]
+                history_result = self.history_collection.insert_many(history_docs, ordered=False, session=session)
+                return result.modified_count + result.upserted_count, len(history_result.inserted_ids)
+            
+            # One transaction per chunk of users keeps each well inside the server's
+            # transaction lifetime and the socket timeout, however big the import
+            all_user_ids = list(per_user)
+            users_updated = meals_saved = 0
+            for start in range(0, len(all_user_ids), _BULK_CHUNK_SIZE):
+                user_ids = all_user_ids[start:start + _BULK_CHUNK_SIZE]
+                chunk_users, chunk_meals = self._run_in_transaction(
+                    lambda session: apply(session, user_ids)
+                )
+                users_updated += chunk_users
+                meals_saved += chunk_meals
+            
+            return {"users_updated": users_updated, "meals_saved": meals_saved}
+            
+        except Exception as e:
+            print(f"Error bulk updating user preferences: {e}")
+            raise
+        finally:
+            # Some updates may have been applied even when the batch failed
+            for user_id in per_user:
+                _invalidate_user(user_id)
+    
+    def _run_in_transaction(self, callback):
+        """
+        Run callback(session) in a transaction, or callback(None) without one.
+        
+        with_transaction retries the callback on transient errors, so it must
+        only issue writes through the session it is given.
+        
+        Args:
+            callback: Function performing the writes
+            
+        Returns:
+            The callback's return value
+        """
+        if not self.supports_transactions:
+            return callback(None)
+        with self.client.start_session() as session:
+            return session.with_transaction(callback)
+    
+    @staticmethod
+    def _normalize_foods(foods: List[str]) -> set:
+        """Normalize food names (lowercase, strip whitespace) and drop blanks."""
+        normalized = set(map(_normalize_food, foods))
+        normalized.discard('')
+        return normalized
+    
+    @classmethod
+    def _meal_preferences(cls, waste_analysis: Dict) -> tuple:
+        """
+        Extract normalized (likes, dislikes) from a waste analysis.
+        
+        A food reported as both liked and disliked counts as disliked.
+        """
+        food_prefs = waste_analysis.get('food_preferences', {})
+        dislikes = cls._normalize_foods(food_prefs.get('likely_dislikes', []))
+        likes = cls._normalize_foods(food_prefs.get('likely_likes', [])) - dislikes
+        return likes, dislikes
+    
+    @staticmethod
+    def _parse_waste_percentage(waste_analysis: Dict) -> Optional[float]:
         """
-        history_doc = {
+        Parse the total waste percentage (e.g. "35%") from a waste analysis.
+        
+        Returns None when it is missing or has no number (e.g. "N/A"), so the
+        meal is left out of the waste average.
+        """
+        waste_summary = waste_analysis.get('waste_summary', {})
+        match = _NUM_RE.search(str(waste_summary.get('total_waste_percentage', '')))
+        return float(match.group()) if match else None
+    
+    @staticmethod
+    def _preference_update_pipeline(
+        new_likes: set,
+        new_dislikes: set,
+        waste_percentages: List[Optional[float]],
+        now: datetime
+    ) -> List[Dict]:
+        """
+        Build the aggregation-pipeline update that applies meals to a user.
+        
+        New likes are removed from disliked_foods and appended to liked_foods (and
+        vice versa) without rebuilding or re-sorting the arrays, and each meal's
+        waste is folded into the running average. Every meal counts towards
+        meal_count, but only meals with a known waste percentage towards the
+        average (tracked by waste_sample_count). Fields missing on a new
+        (upserted) user start out empty.
+        
+        Args:
+            new_likes: Normalized foods the user liked
+            new_dislikes: Normalized foods the user disliked
+            waste_percentages: Waste percentage of each meal being applied, None
+                where it couldn't be parsed
+            now: Timestamp for updated_at (and created_at on a new user)
+            
+        Returns:
+            Update pipeline for find_one_and_update / UpdateOne
+        """
+        # $literal keeps food names that start with "$" from being read as field paths
+        likes = {"$literal": list(new_likes)}
+        dislikes = {"$literal": list(new_dislikes)}
+        meal_count = {"$ifNull": ["$meal_count", 0]}
+        # Users saved before waste_sample_count existed averaged over every meal
+        sample_count = {"$ifNull": ["$waste_sample_count", meal_count]}
+        average = {"$ifNull": ["$total_waste_percentage", 0.0]}
+        known_wastes = [waste for waste in waste_percentages if waste is not None]
+        new_sample_count = {"$add": [sample_count, len(known_wastes)]}
+        new_average = {"$round": [
+            {"$divide": [
+                {"$add": [{"$multiply": [average, sample_count]}, sum(known_wastes)]},
+                new_sample_count
+            ]},
+            2
+        ]} if known_wastes else average
+        
+        return [
+            # Drop foods whose preference flipped
+            {"$set": {
+                "liked_foods": {"$filter": {
+                    "input": {"$ifNull": ["$liked_foods", []]},
+                    "cond": {"$not": [{"$in": ["$$this", dislikes]}]}
+                }},
+                "disliked_foods": {"$filter": {
+                    "input": {"$ifNull": ["$disliked_foods", []]},
+                    "cond": {"$not": [{"$in": ["$$this", likes]}]}
+                }}
+            }},
+            # Append only the foods not already present
+            {"$set": {
+                "user_name": {"$ifNull": ["$user_name", None]},
+                "liked_foods": {"$concatArrays": [
+                    "$liked_foods", {"$setDifference": [likes, "$liked_foods"]}
+                ]},
+                "disliked_foods": {"$concatArrays": [
+                    "$disliked_foods", {"$setDifference": [dislikes, "$disliked_foods"]}
+                ]},
+                "meal_count": {"$add": [meal_count, len(waste_percentages)]},
+                "waste_sample_count": new_sample_count,
+                "total_waste_percentage": new_average,
+                "created_at": {"$ifNull": ["$created_at", now]},
+                "updated_at": now
+            }}
+        ]
+    
+    @staticmethod
+    def _meal_history_doc(user_id: str, waste_analysis: Dict, timestamp: datetime) -> Dict:
+        """Build the meal history document for one analysis."""
+        return {
             "user_id": user_id,
-            "timestamp": datetime.utcnow(),
+            "timestamp": timestamp,
             "original_meal": waste_analysis.get('original_meal', {}),
             "thrown_away": waste_analysis.get('thrown_away', []),
             "eaten": waste_analysis.get('eaten', []),
             "food_preferences": waste_analysis.get('food_preferences', {}),
             "waste_summary": waste_analysis.get('waste_summary', {})
         }
+    
+    def _save_meal_history(self, user_id: str, waste_analysis: Dict, timestamp: datetime, session=None):
+        """
+        Save individual meal analysis to history collection.
         
+        Args:
+            user_id: Unique user identifier
+            waste_analysis: JSON response from food waste analyzer API
+            timestamp: When the meal was recorded
+            session: Transaction session, if any
+        """
         try:
-            self.history_collection.insert_one(history_doc)
+            self.history_collection.insert_one(self._meal_history_doc(user_id, waste_analysis, timestamp), session=session)
         except Exception as e:
             print(f"Error saving meal history: {e}")
             raise
@@ -249,20 +563,28 @@ class UserFoodPreferenceManager:
             User summary with preferences and statistics
         """
         try:
-            user = self.get_user(user_id)
+            # Fetch the user and their 5 most recent meals in one round trip;
+            # the lookup is served by the (user_id, timestamp) history index
+            user = next(self.users_collection.aggregate([
+                {"$match": {"user_id": user_id}},
+                {"$project": _USER_PROJECTION},
+                {"$lookup": {
+                    "from": "meal_history",
+                    "localField": "user_id",
+                    "foreignField": "user_id",
+                    "pipeline": [
+                        {"$sort": {"timestamp": -1}},
+                        {"$limit": 5},
+                        {"$project": {"_id": 0, "original_meal.name": 1, "timestamp": 1, "waste_summary.total_waste_percentage": 1}}
+                    ],
+                    "as": "recent_meals"
+                }}
+            ]), None)
             if not user:
                 return None
             
-            # Get meal history count
-            history_count = self.history_collection.count_documents({"user_id": user_id})
-            
-            # Get recent meals
-            recent_meals = list(
-                self.history_collection
-                .find({"user_id": user_id})
-                .sort("timestamp", -1)
-                .limit(5)
-            )
+            recent_meals = user.pop("recent_meals")
+            _sort_preferences(user)
             
             # Format recent meals
             formatted_meals = []
@@ -278,6 +600,7 @@ class UserFoodPreferenceManager:
                 "user_name": user.get('user_name'),
                 "liked_foods": user.get('liked_foods', []),
                 "disliked_foods": user.get('disliked_foods', []),
+                # meal_count is bumped with every history insert, so it doubles as the history count
                 "total_meals_analyzed": user.get('meal_count', 0),
                 "average_waste_percentage": user.get('total_waste_percentage', 0.0),
                 "recent_meals": formatted_meals,
@@ -288,21 +611,26 @@ class UserFoodPreferenceManager:
             print(f"Error getting user summary: {e}")
             return None
     
-    def get_meal_history(self, user_id: str, limit: int = 10) -> List[Dict]:
+    def get_meal_history(self, user_id: str, limit: int = 10, fields: Optional[List[str]] = None) -> List[Dict]:
         """
         Get meal history for a user.
         
         Args:
             user_id: Unique user identifier
             limit: Maximum number of meals to return
+            fields: Only return these fields (dotted paths allowed); all fields if None
             
         Returns:
             List of meal history documents
         """
+        projection = {"_id": 0}
+        if fields:
+            projection.update({field: 1 for field in fields})
+        
         try:
             meals = list(
                 self.history_collection
-                .find({"user_id": user_id}, {"_id": 0})
+                .find({"user_id": user_id}, projection)
                 .sort("timestamp", -1)
                 .limit(limit)
             )
@@ -334,89 +662,160 @@ class UserFoodPreferenceManager:
             # Delete all meal history
             self.history_collection.delete_many({"user_id": user_id})
             
+            _invalidate_user(user_id)
+            
             return user_result.deleted_count > 0
         except Exception as e:
             print(f"Error deleting user: {e}")
             return False
     
     def close(self):
-        """Close MongoDB connection."""
-        try:
-            self.client.close()
-            print("MongoDB connection closed successfully!")
-        except Exception as e:
-            print(f"Error closing connection: {e}")
+        """
+        Release this manager's MongoDB connection.
+        
+        The client is shared by every manager using the same URI (and a closed
+        PyMongo client can't be reused), so this leaves it open; shared clients
+        are closed once at interpreter exit.
+        """
+        pass
 
 
 # Example usage
-if __name__ == "__main__":
-    try:
-        # Initialize the manager (will read MONGODB_URI from .env)
-        manager = UserFoodPreferenceManager()
-        
-        # Test connection
-        if manager.test_connection():
-            print("✓ Connection test passed!\n")
-        
-        # Example waste analysis JSON (from the food waste analyzer API)
-        waste_analysis = {
-            "original_meal": {
-                "name": "Loaded Fries",
-                "description": "Fries topped with cheese and possibly other ingredients like bacon and jalapenos."
+def _run_demo(manager: UserFoodPreferenceManager):
+    """Apply one example meal and print the resulting user, summary and history."""
+    # Test connection
+    if manager.test_connection():
+        print("✓ Connection test passed!\n")
+    
+    # Example waste analysis JSON (from the food waste analyzer API)
+    waste_analysis = {
+        "original_meal": {
+            "name": "Loaded Fries",
+            "description": "Fries topped with cheese and possibly other ingredients like bacon and jalapenos."
+        },
+        "thrown_away": [
+            {
+                "item": "fries",
+                "quantity": "1/4 cup",
+                "percentage_of_original": "30%"
             },
-            "thrown_away": [
-                {
-                    "item": "fries",
-                    "quantity": "1/4 cup",
-                    "percentage_of_original": "30%"
-                },
-                {
-                    "item": "toppings (cheese, jalapenos)",
-                    "quantity": "1/8 cup",
-                    "percentage_of_original": "40%"
-                }
-            ],
-            "eaten": [
-                {
-                    "item": "fries",
-                    "quantity": "2/3 cup",
-                    "percentage_of_original": "70%"
-                },
-                {
-                    "item": "toppings",
-                    "quantity": "3/8 cup",
-                    "percentage_of_original": "60%"
-                }
-            ],
-            "food_preferences": {
-                "likely_dislikes": ["toppings"],
-                "likely_likes": ["fries"],
-                "insights": "The person seems to prefer plain fries over fries with toppings."
+            {
+                "item": "toppings (cheese, jalapenos)",
+                "quantity": "1/8 cup",
+                "percentage_of_original": "40%"
+            }
+        ],
+        "eaten": [
+            {
+                "item": "fries",
+                "quantity": "2/3 cup",
+                "percentage_of_original": "70%"
             },
-            "waste_summary": {
-                "total_waste_percentage": "35%",
-                "waste_value": "medium"
+            {
+                "item": "toppings",
+                "quantity": "3/8 cup",
+                "percentage_of_original": "60%"
             }
+        ],
+        "food_preferences": {
+            "likely_dislikes": ["toppings"],
+            "likely_likes": ["fries"],
+            "insights": "The person seems to prefer plain fries over fries with toppings."
+        },
+        "waste_summary": {
+            "total_waste_percentage": "35%",
+            "waste_value": "medium"
         }
+    }
+    
+    # Update user preferences
+    user_id = "user123"
+    updated_user = manager.update_user_preferences(user_id, waste_analysis)
+    print("=== Updated User ===")
+    print(orjson.dumps(updated_user, option=orjson.OPT_INDENT_2 | orjson.OPT_NAIVE_UTC).decode())
+    
+    # Get user summary
+    summary = manager.get_user_summary(user_id)
+    print("\n=== User Summary ===")
+    print(orjson.dumps(summary, option=orjson.OPT_INDENT_2 | orjson.OPT_NAIVE_UTC).decode())
+    
+    # Get meal history
+    history = manager.get_meal_history(user_id, limit=5)
+    print("\n=== Meal History ===")
+    print(orjson.dumps(history, option=orjson.OPT_INDENT_2 | orjson.OPT_NAIVE_UTC).decode())
+
+
+def _run_benchmark(manager: UserFoodPreferenceManager, iterations: int):
+    """
+    Time update_user_preferences over generated meals and print latency percentiles.
+    
+    Runs against a throwaway user that is deleted afterwards.
+    
+    Args:
+        manager: Connected preference manager
+        iterations: Number of meals to apply
+    """
+    foods = ["fries", "rice", "chicken", "broccoli", "salad", "pasta", "beans", "pizza"]
+    user_id = f"bench_{uuid.uuid4().hex[:12]}"
+    
+    # Build every analysis up front so only the update itself is timed
+    analyses = [
+        {
+            "original_meal": {"name": f"Bench meal {i}", "description": "Generated for benchmarking"},
+            "thrown_away": [{"item": foods[i % len(foods)], "quantity": "1/4 cup", "percentage_of_original": "25%"}],
+            "eaten": [{"item": foods[(i + 1) % len(foods)], "quantity": "1 cup", "percentage_of_original": "75%"}],
+            "food_preferences": {
+                "likely_likes": [foods[(i + 1) % len(foods)]],
+                "likely_dislikes": [foods[i % len(foods)]],
+                "insights": "Generated for benchmarking"
+            },
+            "waste_summary": {"total_waste_percentage": f"{i % 100}%", "waste_value": "low"}
+        }
+        for i in range(iterations)
+    ]
+    
+    timings_ns = []
+    try:
+        for waste_analysis in analyses:
+            start = time.perf_counter_ns()
+            manager.update_user_preferences(user_id, waste_analysis)
+            timings_ns.append(time.perf_counter_ns() - start)
+    finally:
+        manager.delete_user(user_id)
+    
+    if not timings_ns:
+        return
+    
+    timings_ns.sort()
+    print(f"update_user_preferences x{len(timings_ns)}")
+    for label, quantile in (("p50", 0.50), ("p90", 0.90), ("p99", 0.99), ("max", 1.0)):
+        index = min(int(quantile * len(timings_ns)), len(timings_ns) - 1)
+        print(f"  {label}: {timings_ns[index] / 1e6:.2f} ms")
+
+
+if __name__ == "__main__":
+    # Nothing connects to MongoDB unless asked: UPM_DEMO=1 runs the example,
+    # `--bench N` times N preference updates
+    bench = "--bench" in sys.argv
+    
+    if not bench and not os.getenv("UPM_DEMO"):
+        print("Set UPM_DEMO=1 to run the example, or pass --bench N to benchmark updates.")
+        sys.exit(0)
+    
+    manager = None
+    try:
+        # Initialize the manager (will read MONGODB_URI from .env)
+        manager = UserFoodPreferenceManager()
         
-        # Update user preferences
-        user_id = "user123"
-        updated_user = manager.update_user_preferences(user_id, waste_analysis)
-        print("=== Updated User ===")
-        print(json.dumps(updated_user, indent=2, default=str))
-        
-        # Get user summary
-        summary = manager.get_user_summary(user_id)
-        print("\n=== User Summary ===")
-        print(json.dumps(summary, indent=2))
-        
-        # Get meal history
-        history = manager.get_meal_history(user_id, limit=5)
-        print("\n=== Meal History ===")
-        print(json.dumps(history, indent=2))
+        if bench:
+            arg_index = sys.argv.index("--bench") + 1
+            _run_benchmark(manager, int(sys.argv[arg_index]) if arg_index < len(sys.argv) else 100)
+        else:
+            _run_demo(manager)
         
     except Exception as e:
         print(f"Error in main execution: {e}")
     finally:
         # Close connection
-        manager.close()
\ No newline at end of file
+        if manager is not None:
+            manager.close()
@@ -1,30 +1,27 @@
 import sys
 import os
+from importlib.util import find_spec
 
 # Add current directory to path
 sys.path.append(os.getcwd())
 
-print("Attempting to import modules...")
+print("Locating modules...")
 
-try:
-    import food_analysis_service
-    print("✅ food_analysis_service imported successfully")
-except ImportError as e:
-    print(f"❌ Failed to import food_analysis_service: {e}")
-    sys.exit(1)
+# find_spec only resolves each module on sys.path; it does not run module-level
+# code (MongoDB/OpenAI clients, the Flask app, ...)
+for name in ("food_analysis_service", "services", "api_atlas"):
+    if find_spec(name) is None:
+        print(f"❌ Could not find {name}")
+        sys.exit(1)
+    print(f"✅ {name} found")
 
-try:
-    import services
-    print("✅ services imported successfully")
-except ImportError as e:
-    print(f"❌ Failed to import services: {e}")
-    sys.exit(1)
-
-try:
-    from api_atlas import app
-    print("✅ api_atlas imported successfully")
-except ImportError as e:
-    print(f"❌ Failed to import api_atlas: {e}")
-    sys.exit(1)
+# Importing the app runs all of that setup, so only do it when asked
+if "--import-app" in sys.argv:
+    try:
+        from api_atlas import app
+        print("✅ api_atlas imported successfully")
+    except ImportError as e:
+        print(f"❌ Failed to import api_atlas: {e}")
+        sys.exit(1)
 
 print("All modules verified.")